@@ -179,6 +179,223 @@ exports.getPublicAttendance = async (req, res) => {
     }
 };
 
+// Records the next attendance event (in, lunch-start, lunch-end, out) for staffId at time now.
+// With replay, scans at or before the day's latest recorded event are skipped, so a
+// resent queue or a queued scan older than a live clock-in does not advance the day.
+const recordAttendance = async (staffId, now, { replay = false } = {}) => {
+    if (!mongoose.Types.ObjectId.isValid(staffId)) {
+        return {
+            status: 400,
+            body: {
+                success: false,
+                message: "Invalid staff ID",
+            },
+        };
+    }
+
+    const staff = await Users.findById(staffId);
+
+    if (!staff) {
+        return {
+            status: 404,
+            body: {
+                success: false,
+                message: "Staff not found",
+            },
+        };
+    }
+
+    const today = new Date(now.getFullYear(), now.getMonth(), now.getDate());
+    const dayOfWeek = now.getDay();
+
+    let shiftSchedule = null;
+    let isWorkday = false;
+
+    if (staff.assignedShift) {
+        const shift = await Shift.findById(staff.assignedShift);
+        if (shift) {
+            isWorkday = shift.isWorkday(dayOfWeek);
+            if (isWorkday) {
+                shiftSchedule = shift.getScheduleForDay(dayOfWeek);
+            }
+        }
+    }
+    if (!shiftSchedule && staff.customSchedule) {
+        const dayNames = [
+            "sunday",
+            "monday",
+            "tuesday",
+            "wednesday",
+            "thursday",
+            "friday",
+            "saturday",
+        ];
+        const dayName = dayNames[dayOfWeek];
+
+        if (
+            staff.customSchedule[dayName] &&
+            staff.customSchedule[dayName].isWorkday
+        ) {
+            isWorkday = true;
+            shiftSchedule = {
+                startTime: staff.customSchedule[dayName].startTime,
+                endTime: staff.customSchedule[dayName].endTime,
+                lunchStartTime: staff.customSchedule[dayName].lunchStartTime,
+                lunchDuration: staff.customSchedule[dayName].lunchDuration,
+            };
+        }
+    }
+
+    if (!isWorkday) {
+        return {
+            status: 400,
+            body: {
+                success: false,
+                message: "Today is not a workday according to your schedule",
+            },
+        };
+    }
+
+    let attendance = await Attendance.findOne({
+        staffId,
+        date: {
+            $gte: today,
+            $lt: new Date(today.getTime() + 24 * 60 * 60 * 1000),
+        },
+    });
+
+    if (attendance && replay) {
+        const latest = [
+            attendance.timeIn,
+            attendance.lunchStart,
+            attendance.lunchEnd,
+            attendance.timeOut,
+        ]
+            .filter(Boolean)
+            .reduce((a, b) => (a > b ? a : b), null);
+
+        if (latest && now <= latest) {
+            return {
+                status: 409,
+                body: {
+                    success: false,
+                    skipped: true,
+                    message: "Scan is not later than the latest attendance recorded for this day",
+                },
+            };
+        }
+    }
+
+    let attendanceType = "in";
+    let message = "Clock-in recorded successfully";
+
+    if (attendance) {
+        if (!attendance.timeIn) {
+            attendanceType = "in";
+            message = "Clock-in recorded successfully";
+        } else if (attendance.timeIn && !attendance.lunchStart) {
+            attendanceType = "lunch-start";
+            message = "Lunch break started successfully";
+        } else if (attendance.lunchStart && !attendance.lunchEnd) {
+            attendanceType = "lunch-end";
+            message = "Lunch break ended successfully";
+        } else if (attendance.timeIn && !attendance.timeOut) {
+            attendanceType = "out";
+            message = "Clock-out recorded successfully";
+        } else {
+            return {
+                status: 400,
+                body: {
+                    success: false,
+                    message: "All attendance records already completed for today",
+                },
+            };
+        }
+    } else {
+        attendance = new Attendance({
+            staffId,
+            date: today,
+            status: "present",
+        });
+    }
+
+    if (attendanceType === "in") {
+        attendance.timeIn = now;
+
+        if (shiftSchedule) {
+            const [startHour, startMinute] = shiftSchedule.startTime
+                .split(":")
+                .map(Number);
+
+            const shiftStart = new Date(today);
+            shiftStart.setHours(startHour, startMinute, 0, 0.0);
+
+            if (now > shiftStart) {
+                const lateMinutes = Math.floor((now - shiftStart) / (1000 * 60));
+
+                const gracePeriod = staff.gracePeriod || 15;
+
+                if (lateMinutes > gracePeriod) {
+                    attendance.status = "late";
+                    attendance.lateMinutes = lateMinutes;
+                }
+            }
+        }
+    } else if (attendanceType === "lunch-start") {
+        attendance.lunchStart = now;
+    } else if (attendanceType === "lunch-end") {
+        attendance.lunchEnd = now;
+    } else if (attendanceType === "out") {
+        attendance.timeOut = now;
+
+        if (shiftSchedule) {
+            const [endHour, endMinute] = shiftSchedule.endTime
+                .split(":")
+                .map(Number);
+
+            const shiftEnd = new Date(today);
+            shiftEnd.setHours(endHour, endMinute, 0, 0);
+
+            if (now > shiftEnd) {
+                const overtimeMinutes = Math.floor((now - shiftEnd) / (1000 * 60));
+                attendance.overtime = overtimeMinutes;
+            }
+
+            if (attendance.timeIn) {
+                let totalMinutes = Math.floor(
+                    (now - attendance.timeIn) / (1000 * 60)
+                );
+
+                if (attendance.lunchStart && attendance.lunchEnd) {
+                    const lunchMinutes = Math.floor(
+                        (attendance.lunchEnd - attendance.lunchStart) / (1000 * 60)
+                    );
+                    totalMinutes -= lunchMinutes;
+                }
+
+                attendance.totalHoursWorked = Math.max(0, totalMinutes / 60);
+            }
+        }
+    }
+
+    await attendance.save();
+
+    return {
+        status: 200,
+        body: {
+            success: true,
+            message: message,
+            data: {
+                attendance,
+                attendanceType,
+                staffName: `${staff.firstname} ${staff.lastname}`,
+                department: staff.department,
+                position: staff.position,
+            },
+        },
+    };
+};
+
 exports.clockIn = async (req, res) => {
     try {
         const { fingerprint, staffId } = req.body;
@@ -216,183 +433,124 @@ exports.clockIn = async (req, res) => {
             });
         }
 
-        if (!mongoose.Types.ObjectId.isValid(identifiedStaffId)) {
-            return res.status(400).json({
-                success: false,
-                message: "Invalid staff ID",
-            });
-        }
+        const { status, body } = await recordAttendance(identifiedStaffId, new Date());
+
+        res.status(status).json(body);
+    } catch (err) {
+        console.error(err);
+        res.status(500).json({
+            success: false,
+            message: "Error recording attendance",
+            error: err.message,
+        });
+    }
+};
 
-        const staff = await Users.findById(identifiedStaffId);
+exports.clockInBatch = async (req, res) => {
+    try {
+        const { probes } = req.body;
 
-        if (!staff) {
-            return res.status(404).json({
+        if (!Array.isArray(probes) || probes.length === 0) {
+            return res.status(400).json({
                 success: false,
-                message: "Staff not found",
+                message: "Missing fingerprint probes",
             });
         }
 
-        const now = new Date();
-        const today = new Date(now.getFullYear(), now.getMonth(), now.getDate());
-        const dayOfWeek = now.getDay();
-
-        let shiftSchedule = null;
-        let isWorkday = false;
-
-        if (staff.assignedShift) {
-            const shift = await Shift.findById(staff.assignedShift);
-            if (shift) {
-                isWorkday = shift.isWorkday(dayOfWeek);
-                if (isWorkday) {
-                    shiftSchedule = shift.getScheduleForDay(dayOfWeek);
-                }
-            }
-        }
-        if (!shiftSchedule && staff.customSchedule) {
-            const dayNames = [
-                "sunday",
-                "monday",
-                "tuesday",
-                "wednesday",
-                "thursday",
-                "friday",
-                "saturday",
-            ];
-            const dayName = dayNames[dayOfWeek];
-
-            if (
-                staff.customSchedule[dayName] &&
-                staff.customSchedule[dayName].isWorkday
-            ) {
-                isWorkday = true;
-                shiftSchedule = {
-                    startTime: staff.customSchedule[dayName].startTime,
-                    endTime: staff.customSchedule[dayName].endTime,
-                    lunchStartTime: staff.customSchedule[dayName].lunchStartTime,
-                    lunchDuration: staff.customSchedule[dayName].lunchDuration,
-                };
-            }
-        }
-
-        if (!isWorkday) {
+        if (probes.some(
+                (probe) =>
+                    !probe ||
+                    typeof probe.fingerPrint !== "string" ||
+                    isNaN(new Date(probe.capturedAt))
+            )) {
             return res.status(400).json({
                 success: false,
-                message: "Today is not a workday according to your schedule",
+                message: "Every probe needs a fingerprint and a valid capturedAt time",
             });
         }
 
-        let attendance = await Attendance.findOne({
-            staffId: identifiedStaffId,
-            date: {
-                $gte: today,
-                $lt: new Date(today.getTime() + 24 * 60 * 60 * 1000),
-            },
-        });
+        // Replay oldest first so each staff member's records advance in, lunch, out in order
+        const order = probes
+            .map((probe, index) => ({ probe, index }))
+            .sort((a, b) => new Date(a.probe.capturedAt) - new Date(b.probe.capturedAt));
 
-        let attendanceType = "in";
-        let message = "Clock-in recorded successfully";
+        let recorded = 0;
+        let skipped = 0;
 
-        if (attendance) {
-            if (!attendance.timeIn) {
-                attendanceType = "in";
-                message = "Clock-in recorded successfully";
-            } else if (attendance.timeIn && !attendance.lunchStart) {
-                attendanceType = "lunch-start";
-                message = "Lunch break started successfully";
-            } else if (attendance.lunchStart && !attendance.lunchEnd) {
-                attendanceType = "lunch-end";
-                message = "Lunch break ended successfully";
-            } else if (attendance.timeIn && !attendance.timeOut) {
-                attendanceType = "out";
-                message = "Clock-out recorded successfully";
-            } else {
-                return res.status(400).json({
-                    success: false,
-                    message: "All attendance records already completed for today",
-                });
+        const writeLine = (line) => {
+            if (!res.headersSent) {
+                res.status(200).setHeader("Content-Type", "application/x-ndjson");
             }
-        } else {
-            attendance = new Attendance({
-                staffId: identifiedStaffId,
-                date: today,
-                status: "present",
-            });
-        }
-
-        if (attendanceType === "in") {
-            attendance.timeIn = now;
-
-            if (shiftSchedule) {
-                const [startHour, startMinute] = shiftSchedule.startTime
-                    .split(":")
-                    .map(Number);
-
-                const shiftStart = new Date(today);
-                shiftStart.setHours(startHour, startMinute, 0, 0.0);
-
-                if (now > shiftStart) {
-                    const lateMinutes = Math.floor((now - shiftStart) / (1000 * 60));
+            res.write(JSON.stringify(line) + "\n");
+        };
 
-                    const gracePeriod = staff.gracePeriod || 15;
+        const result = await fingerprintService.matchFingerprintBatch(
+            order.map(({ probe }) => probe),
+            async (match) => {
+                const line = {
+                    index: order[match.index].index,
+                    capturedAt: match.capturedAt,
+                    matched: match.matched,
+                };
 
-                    if (lateMinutes > gracePeriod) {
-                        attendance.status = "late";
-                        attendance.lateMinutes = lateMinutes;
-                    }
-                }
-            }
-        } else if (attendanceType === "lunch-start") {
-            attendance.lunchStart = now;
-        } else if (attendanceType === "lunch-end") {
-            attendance.lunchEnd = now;
-        } else if (attendanceType === "out") {
-            attendance.timeOut = now;
-
-            if (shiftSchedule) {
-                const [endHour, endMinute] = shiftSchedule.endTime
-                    .split(":")
-                    .map(Number);
-
-                const shiftEnd = new Date(today);
-                shiftEnd.setHours(endHour, endMinute, 0, 0);
-
-                if (now > shiftEnd) {
-                    const overtimeMinutes = Math.floor((now - shiftEnd) / (1000 * 60));
-                    attendance.overtime = overtimeMinutes;
+                if (!match.matched) {
+                    writeLine({
+                        ...line,
+                        success: false,
+                        message: match.message || "No matching fingerprint found",
+                    });
+                    return;
                 }
 
-                if (attendance.timeIn) {
-                    let totalMinutes = Math.floor(
-                        (now - attendance.timeIn) / (1000 * 60)
+                try {
+                    const { body } = await recordAttendance(
+                        match.staffId,
+                        new Date(match.capturedAt),
+                        { replay: true }
                     );
-
-                    if (attendance.lunchStart && attendance.lunchEnd) {
-                        const lunchMinutes = Math.floor(
-                            (attendance.lunchEnd - attendance.lunchStart) / (1000 * 60)
-                        );
-                        totalMinutes -= lunchMinutes;
-                    }
-
-                    attendance.totalHoursWorked = Math.max(0, totalMinutes / 60);
+                    if (body.success) recorded++;
+                    if (body.skipped) skipped++;
+
+                    writeLine({
+                        ...line,
+                        staffId: match.staffId,
+                        success: body.success,
+                        skipped: Boolean(body.skipped),
+                        message: body.message,
+                        attendanceType: body.data?.attendanceType,
+                    });
+                } catch (err) {
+                    console.error(err);
+                    writeLine({
+                        ...line,
+                        staffId: match.staffId,
+                        success: false,
+                        message: "Error recording attendance",
+                        error: err.message,
+                    });
                 }
             }
-        }
+        );
 
-        await attendance.save();
+        if (!result.success && !res.headersSent) {
+            return res.status(result.status || 500).json(result);
+        }
 
-        res.status(200).json({
-            success: true,
-            message: message,
-            data: {
-                attendance,
-                attendanceType,
-                staffName: `${staff.firstname} ${staff.lastname}`,
-                department: staff.department,
-                position: staff.position,
-            },
-        });
+        writeLine({ done: true, ...result, recorded, skipped });
+        res.end();
     } catch (err) {
         console.error(err);
+        if (res.headersSent) {
+            res.write(
+                JSON.stringify({
+                    done: true,
+                    success: false,
+                    message: "Error recording attendance",
+                    error: err.message,
+                }) + "\n"
+            );
+            return res.end();
+        }
         res.status(500).json({
             success: false,
             message: "Error recording attendance",
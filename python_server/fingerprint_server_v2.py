@@ -1,34 +1,28 @@
+import time
+PROCESS_START = time.time()
+
 import cv2
 import numpy as np
 import base64
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-import io
-from PIL import Image
 import os
 import json
-import time
 import threading
-import multiprocessing
-import traceback
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import logging.handlers
+import queue
+import random
+import atexit
+import copy
 import uuid
 import hashlib
 from functools import lru_cache
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('fingerprint_server.log')
-    ]
-)
 logger = logging.getLogger(__name__)
 
-NUM_CORES = max(1, int(multiprocessing.cpu_count() * 0.75))
-logger.info(f"Using {NUM_CORES} CPU cores for processing")
-
 class NumpyJSONEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, np.integer):
@@ -55,7 +49,100 @@ class Config:
     REQUEST_TIMEOUT = 60    # Default request timeout in seconds
     MAX_TEMPLATE_SIZE = 100 # Increased from 50 to store more descriptors
     MAX_IMAGE_SIZE = 500    # Increased from 400 for more detailed processing
+    SEGMENT_BLOCK_SIZE = 16        # Block size for foreground variance segmentation
+    SEGMENT_VARIANCE_RATIO = 0.3   # Block variance threshold relative to the 95th percentile block
+    SEGMENT_MIN_VARIANCE = 100     # Absolute floor so flat frames are not treated as ridges
+    SEGMENT_MIN_COVERAGE = 0.05    # Fall back to the full frame below this foreground fraction
+    EMBEDDING_GRID = 4             # Cells per side for the ridge-frequency and minutiae grids
+    ORIENTATION_BINS = 16          # Orientation histogram bins over [0, pi)
+    PREFILTER_TOP_K = 10           # Templates passed to full scoring after embedding ranking
+    PREFILTER_ACCEPT_SCORE = 0.7   # Top-K winner accepted without a full scan; above the impostor range (max 0.55 on sample scans)
+    MAX_BATCH_SIZE = 500           # Probes accepted per match-batch request
     DEBUG_MODE = os.environ.get('DEBUG_MODE', 'false').lower() == 'true'
+    LOG_FILE = os.environ.get('LOG_FILE', 'fingerprint_server.log')
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+    LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.1))  # Fraction of per-request INFO events kept
+    WARMUP_SCANS = 3        # Synthetic scans pushed through the pipeline before reporting ready
+    GALLERY_SNAPSHOT = os.environ.get('GALLERY_SNAPSHOT')  # Optional JSON list of {staffId, template} to warm up matching against
+
+class JSONLogFormatter(logging.Formatter):
+    """Render log records as one JSON object per line"""
+    def format(self, record):
+        payload = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage()
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            payload.update(fields)
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, cls=NumpyJSONEncoder)
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that keeps structured fields intact for the listener's formatter"""
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_log_listener = None
+
+def setup_logging():
+    """Route all log output through a queue drained by a background listener thread"""
+    global _log_listener
+    if _log_listener is not None:
+        return
+    
+    formatter = JSONLogFormatter()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    file_handler = logging.handlers.RotatingFileHandler(
+        Config.LOG_FILE, maxBytes=Config.LOG_MAX_BYTES, backupCount=Config.LOG_BACKUP_COUNT
+    )
+    file_handler.setFormatter(formatter)
+    
+    # Request threads only enqueue records; formatting, writes and rotation
+    # all happen on the listener thread.
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(StructuredQueueHandler(log_queue))
+    
+    _log_listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, file_handler, respect_handler_level=True
+    )
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+# Set per request; worker threads inherit it when submitted via contextvars.copy_context()
+current_request_id = contextvars.ContextVar('request_id', default=None)
+
+def log_event(event, level=logging.INFO, sampled=False, exc_info=False, **fields):
+    """Emit a structured log event; sampled events are kept at Config.LOG_SAMPLE_RATE"""
+    if not logger.isEnabledFor(level):
+        return
+    if sampled and random.random() >= Config.LOG_SAMPLE_RATE:
+        return
+    request_id = current_request_id.get()
+    if request_id:
+        fields.setdefault('request_id', request_id)
+    logger.log(level, event, extra={'fields': fields}, exc_info=exc_info)
+
+NUM_CORES = max(1, int((os.cpu_count() or 1) * 0.75))
+
+@app.before_request
+def assign_request_id():
+    current_request_id.set(request.headers.get('X-Request-Id') or uuid.uuid4().hex[:12])
 
 @lru_cache(maxsize=Config.CACHE_SIZE)
 def get_cached_template(template_id):
@@ -72,7 +159,7 @@ def base64_to_image(base64_string):
                 base64_string = base64_string.split(',')[1]
             
             if not all(c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=' for c in base64_string):
-                logger.warning("Invalid base64 character detected")
+                log_event('decode_invalid_base64', level=logging.WARNING)
                 return None
         
         img_data = base64.b64decode(base64_string)
@@ -86,14 +173,54 @@ def base64_to_image(base64_string):
                 img = cv2.cvtColor(color_img, cv2.COLOR_BGR2GRAY)
         
         if img is None or img.size == 0:
-            logger.warning("Decoded image is empty or invalid")
+            log_event('decode_empty_image', level=logging.WARNING)
             return None
             
         return img
     except Exception as e:
-        logger.error(f"Error converting base64 to image: {e}")
+        log_event('decode_error', level=logging.ERROR, error=str(e))
         return None
 
+def segment_foreground(img):
+    """Block-variance foreground mask and bounding box (x0, y0, x1, y1) of the fingerprint region"""
+    height, width = img.shape
+    block = Config.SEGMENT_BLOCK_SIZE
+    grid_h, grid_w = height // block, width // block
+    full_frame = (np.full((height, width), 255, np.uint8), (0, 0, width, height))
+    
+    if grid_h < 3 or grid_w < 3:
+        return full_frame
+    
+    blocks = img[:grid_h * block, :grid_w * block].astype(np.float32)
+    block_var = blocks.reshape(grid_h, block, grid_w, block).var(axis=(1, 3))
+    threshold = max(Config.SEGMENT_MIN_VARIANCE,
+                    Config.SEGMENT_VARIANCE_RATIO * np.percentile(block_var, 95))
+    
+    kernel = np.ones((3, 3), np.uint8)
+    block_mask = (block_var > threshold).astype(np.uint8)
+    block_mask = cv2.morphologyEx(block_mask, cv2.MORPH_CLOSE, kernel)
+    # Opening cuts thin bridges to sensor-edge artifacts, which then form smaller
+    # blobs than the finger and are dropped
+    block_mask = cv2.morphologyEx(block_mask, cv2.MORPH_OPEN, np.ones((5, 5), np.uint8))
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(block_mask, connectivity=4)
+    if count > 2:
+        block_mask = (labels == 1 + np.argmax(stats[1:, cv2.CC_STAT_AREA])).astype(np.uint8)
+    block_mask = cv2.dilate(block_mask, kernel)
+    
+    if block_mask.mean() < Config.SEGMENT_MIN_COVERAGE:
+        return full_frame
+    
+    mask = np.zeros((height, width), np.uint8)
+    mask[:grid_h * block, :grid_w * block] = np.kron(block_mask, np.ones((block, block), np.uint8)) * 255
+    
+    # Pad by one block so blur/threshold border effects stay outside the ridge area
+    rows = np.flatnonzero(block_mask.any(axis=1))
+    cols = np.flatnonzero(block_mask.any(axis=0))
+    bbox = (max(0, int(cols[0] - 1) * block), max(0, int(rows[0] - 1) * block),
+            min(width, int(cols[-1] + 2) * block), min(height, int(rows[-1] + 2) * block))
+    
+    return mask, bbox
+
 def enhance_fingerprint_image(img):
     """Enhanced preprocessing specific for the device's fingerprint output"""
     if img is None:
@@ -104,7 +231,12 @@ def enhance_fingerprint_image(img):
         scale = min(Config.MAX_IMAGE_SIZE / width, Config.MAX_IMAGE_SIZE / height)
         img = cv2.resize(img, None, fx=scale, fy=scale)
     
-    hist_eq = cv2.equalizeHist(img)
+    # Every later stage only sees the fingerprint region; feature coordinates
+    # are shifted back to the full frame by 'offset'
+    mask, (x0, y0, x1, y1) = segment_foreground(img)
+    mask = mask[y0:y1, x0:x1]
+    
+    hist_eq = cv2.equalizeHist(img[y0:y1, x0:x1])
     clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
     enhanced = clahe.apply(hist_eq)
     blurred = cv2.GaussianBlur(enhanced, (5, 5), 0)
@@ -112,6 +244,7 @@ def enhance_fingerprint_image(img):
         blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
         cv2.THRESH_BINARY_INV, 19, 2
     )
+    binary = cv2.bitwise_and(binary, mask)
     kernel = np.ones((3,3), np.uint8)
     morph = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
     
@@ -119,93 +252,138 @@ def enhance_fingerprint_image(img):
         'original': img,
         'enhanced': enhanced,
         'binary': binary,
-        'morph': morph
+        'morph': morph,
+        'mask': mask,
+        'offset': (x0, y0)
     }
 
+def extract_minutiae(morph, binary, offset=(0, 0)):
+    """Minutiae candidates from ridge contours, deduplicated on a 5px grid and capped at 40"""
+    offset_x, offset_y = offset
+    xs, ys, types, areas = [], [], [], []
+    
+    contours, _ = cv2.findContours(morph, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for contour in contours[:50]:
+        if len(contour) > 3:
+            M = cv2.moments(contour)
+            if M["m00"] != 0:
+                area = cv2.contourArea(contour)
+                perimeter = cv2.arcLength(contour, True)
+                if area > 8:
+                    xs.append(int(M["m10"] / M["m00"]))
+                    ys.append(int(M["m01"] / M["m00"]))
+                    types.append('bifurcation' if area/perimeter > 1.5 else 'ending')
+                    areas.append(area)
+    
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for contour in contours:
+        if len(contour) > 5:
+            M = cv2.moments(contour)
+            if M["m00"] != 0:
+                area = cv2.contourArea(contour)
+                if area > 10:
+                    xs.append(int(M["m10"] / M["m00"]))
+                    ys.append(int(M["m01"] / M["m00"]))
+                    types.append('contour')
+                    areas.append(area)
+    
+    xs = np.asarray(xs, np.int64) + offset_x
+    ys = np.asarray(ys, np.int64) + offset_y
+    
+    # Keep the first point in each 5x5 cell, preserving extraction order
+    cells = (xs // 5) * (int(ys.max(initial=0)) // 5 + 1) + ys // 5
+    _, first_idx = np.unique(cells, return_index=True)
+    first_idx = np.sort(first_idx)[:40]
+    
+    return [{
+        'x': int(xs[i]),
+        'y': int(ys[i]),
+        'type': types[i],
+        'area': float(areas[i])
+    } for i in first_idx]
+
+def compute_global_embedding(processed, minutiae):
+    """Fixed-length descriptor: orientation histogram, ridge-frequency grid and minutiae density grid"""
+    mask = processed['mask']
+    height, width = mask.shape
+    grid = Config.EMBEDDING_GRID
+    
+    # The orientation field is smooth, so estimate it at half resolution
+    small = cv2.pyrDown(processed['enhanced']).astype(np.float32)
+    foreground = cv2.resize(mask, (small.shape[1], small.shape[0]), interpolation=cv2.INTER_NEAREST) > 0
+    gx = cv2.Sobel(small, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(small, cv2.CV_32F, 0, 1, ksize=3)
+    gxx = cv2.boxFilter(gx * gx, -1, (7, 7))[foreground]
+    gyy = cv2.boxFilter(gy * gy, -1, (7, 7))[foreground]
+    gxy = cv2.boxFilter(gx * gy, -1, (7, 7))[foreground]
+    orientation = (0.5 * np.arctan2(2 * gxy, gxx - gyy) + np.pi / 2) % np.pi
+    coherence = np.sqrt((gxx - gyy) ** 2 + 4 * gxy ** 2)
+    orientation_hist, _ = np.histogram(
+        orientation, bins=Config.ORIENTATION_BINS, range=(0, np.pi), weights=coherence)
+    
+    # Ridge crossings per foreground pixel along rows and columns, pooled per cell
+    binary = processed['binary']
+    crossings = np.zeros((height, width), np.uint8)
+    crossings[:, 1:] = cv2.absdiff(binary[:, 1:], binary[:, :-1]) // 255
+    crossings[1:, :] += cv2.absdiff(binary[1:, :], binary[:-1, :]) // 255
+    crossings_grid = cv2.resize(crossings.astype(np.float32), (grid, grid), interpolation=cv2.INTER_AREA)
+    coverage_grid = cv2.resize(mask.astype(np.float32) / 255, (grid, grid), interpolation=cv2.INTER_AREA)
+    frequency_grid = crossings_grid / np.maximum(coverage_grid, 1e-3)
+    
+    offset_x, offset_y = processed['offset']
+    density_grid = np.zeros((grid, grid), np.float32)
+    if minutiae:
+        xs = np.array([m['x'] for m in minutiae]) - offset_x
+        ys = np.array([m['y'] for m in minutiae]) - offset_y
+        density_grid, _, _ = np.histogram2d(ys, xs, bins=grid, range=[[0, height], [0, width]])
+    
+    parts = []
+    for part in (orientation_hist, frequency_grid, density_grid):
+        part = np.asarray(part, np.float32).ravel()
+        norm = np.linalg.norm(part)
+        parts.append(part / norm if norm > 0 else part)
+    
+    return np.concatenate(parts) / np.sqrt(len(parts))
+
 def process_fingerprint(image_data):
     """Enhanced fingerprint processing with more robust feature extraction"""
     try:
+        timings = {}
+        stage_start = time.time()
         img = base64_to_image(image_data)
+        timings['decode'] = time.time() - stage_start
         if img is None:
-            logger.error("Failed to convert base64 to image")
+            log_event('decode_failed', level=logging.ERROR)
             return None
         
+        stage_start = time.time()
         processed = enhance_fingerprint_image(img)
+        timings['enhance'] = time.time() - stage_start
         if processed is None:
             return None
         
-        minutiae_points = []
+        stage_start = time.time()
+        filtered_minutiae = extract_minutiae(processed['morph'], processed['binary'], processed['offset'])
+        timings['minutiae'] = time.time() - stage_start
         
-        binary = processed['binary']
-        morph = processed['morph']
-        
-        contours, _ = cv2.findContours(
-            morph, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        for contour in contours[:50]:  
-            if len(contour) > 3:  
-                M = cv2.moments(contour)
-                if M["m00"] != 0:
-                    cX = int(M["m10"] / M["m00"])
-                    cY = int(M["m01"] / M["m00"])
-                    
-                    area = cv2.contourArea(contour)
-                    perimeter = cv2.arcLength(contour, True)
-                    
-                    if area > 8: 
-                        minutiae_points.append({
-                            'x': cX,
-                            'y': cY,
-                            'type': 'bifurcation' if area/perimeter > 1.5 else 'ending',
-                            'area': float(area)
-                        })
-        
-        contours, _ = cv2.findContours(
-            processed['binary'], 
-            cv2.RETR_EXTERNAL, 
-            cv2.CHAIN_APPROX_SIMPLE
-        )
-        
-        for contour in contours:
-            if len(contour) > 5: 
-                M = cv2.moments(contour)
-                if M["m00"] != 0:
-                    cX = int(M["m10"] / M["m00"])
-                    cY = int(M["m01"] / M["m00"])
-                    area = cv2.contourArea(contour)
-                    
-                    if area > 10:
-                        minutiae_points.append({
-                            'x': cX,
-                            'y': cY,
-                            'type': 'contour',
-                            'area': float(area)
-                        })
-        
-        filtered_minutiae = []
-        used_positions = set()
-        
-        for m in minutiae_points:
-            pos_key = f"{m['x']//5}_{m['y']//5}" 
-            if pos_key not in used_positions:
-                filtered_minutiae.append(m)
-                used_positions.add(pos_key)
-        
-        if len(filtered_minutiae) > 40:
-            filtered_minutiae = filtered_minutiae[:40]
+        stage_start = time.time()
+        embedding = compute_global_embedding(processed, filtered_minutiae)
+        timings['embedding'] = time.time() - stage_start
         
+        stage_start = time.time()
+        offset_x, offset_y = processed['offset']
         orb = cv2.ORB_create(nfeatures=200, scaleFactor=1.2, WTA_K=3)
-        orb_keypoints, orb_descriptors = orb.detectAndCompute(processed['enhanced'], None)
+        orb_keypoints, orb_descriptors = orb.detectAndCompute(processed['enhanced'], processed['mask'])
         akaze = cv2.AKAZE_create()
-        akaze_keypoints, akaze_descriptors = akaze.detectAndCompute(processed['enhanced'], None)
+        akaze_keypoints, akaze_descriptors = akaze.detectAndCompute(processed['enhanced'], processed['mask'])
         
         combined_keypoints = []
         
         if orb_keypoints:
             for kp in orb_keypoints[:30]: 
                 combined_keypoints.append({
-                    'x': float(kp.pt[0]),
-                    'y': float(kp.pt[1]),
+                    'x': float(kp.pt[0] + offset_x),
+                    'y': float(kp.pt[1] + offset_y),
                     'size': float(kp.size),
                     'angle': float(kp.angle) if kp.angle is not None else 0,
                     'response': float(kp.response),
@@ -215,14 +393,16 @@ def process_fingerprint(image_data):
         if akaze_keypoints:
             for kp in akaze_keypoints[:30]: 
                 combined_keypoints.append({
-                    'x': float(kp.pt[0]),
-                    'y': float(kp.pt[1]),
+                    'x': float(kp.pt[0] + offset_x),
+                    'y': float(kp.pt[1] + offset_y),
                     'size': float(kp.size),
                     'angle': float(kp.angle) if kp.angle is not None else 0,
                     'response': float(kp.response),
                     'detector': 'akaze'
                 })
         
+        timings['descriptors'] = time.time() - stage_start
+        
         orb_desc_list = []
         if orb_descriptors is not None:
             orb_desc_list = orb_descriptors.tolist()
@@ -231,7 +411,7 @@ def process_fingerprint(image_data):
         if akaze_descriptors is not None:
             akaze_desc_list = akaze_descriptors.tolist()
         
-        contrast = float(np.std(processed['enhanced']))
+        contrast = float(np.std(processed['enhanced'][processed['mask'] > 0]))
         feature_count = len(combined_keypoints)
         minutiae_count = len(filtered_minutiae)
         
@@ -252,10 +432,11 @@ def process_fingerprint(image_data):
             'orb_descriptors': orb_desc_list[:Config.MAX_TEMPLATE_SIZE],
             'akaze_descriptors': akaze_desc_list[:Config.MAX_TEMPLATE_SIZE],
             'quality': quality,
+            'embedding': embedding.tolist(),
+            'timings': timings,
         }
     except Exception as e:
-        logger.error(f"Error processing fingerprint: {e}")
-        traceback.print_exc()
+        log_event('extraction_error', level=logging.ERROR, exc_info=True, error=str(e))
         return None
 
 @app.route('/api/fingerprint/process-single', methods=['POST'])
@@ -277,7 +458,6 @@ def process_single_fingerprint():
         return jsonify({'success': False, 'message': 'Missing staff ID'}), 400
     
     try:
-        logger.info(f"Processing fingerprint for staff ID: {staff_id}")
         features = process_fingerprint(fingerprint)
         
         if not features:
@@ -290,14 +470,16 @@ def process_single_fingerprint():
             'keypoints': features.get('keypoints', [])[:40],
             'orb_descriptors': features.get('orb_descriptors', [])[:Config.MAX_TEMPLATE_SIZE],
             'akaze_descriptors': features.get('akaze_descriptors', [])[:Config.MAX_TEMPLATE_SIZE],
-            'quality': features.get('quality', {})
+            'quality': features.get('quality', {}),
+            'embedding': features.get('embedding')
         }
         
         template_id = f"{staff_id}_{hashlib.md5(str(template).encode()).hexdigest()[:8]}"
         template_cache[template_id] = template
         
         processing_time = time.time() - start_time
-        logger.info(f"Processed fingerprint in {processing_time:.3f}s with quality {quality:.1f}")
+        log_event('enrollment_processed', sampled=True, staff_id=staff_id,
+                  duration=processing_time, quality=quality, timings=features.get('timings'))
         
         return jsonify({
             'success': True,
@@ -307,8 +489,7 @@ def process_single_fingerprint():
             'processing_time': float(processing_time)
         })
     except Exception as e:
-        logger.error(f"Error processing fingerprint: {e}")
-        traceback.print_exc()
+        log_event('enrollment_error', level=logging.ERROR, exc_info=True, error=str(e))
         return jsonify({'success': False, 'message': f'Error processing fingerprint: {str(e)}'}), 500
 
 class ImprovedFingerprintMatcher:
@@ -558,6 +739,120 @@ class ImprovedFingerprintMatcher:
         
         return min(1.0, combined_score)
 
+def match_confidence(score):
+    """Confidence label for a match score"""
+    if score >= 0.7:
+        return "high"
+    elif score >= 0.55:
+        return "medium"
+    return "low"
+
+def match_summary(match_results):
+    """Response fields for the best of a sorted list of match results"""
+    if match_results and match_results[0]['score'] >= Config.MATCH_THRESHOLD:
+        top_match = match_results[0]
+        return {
+            'success': True,
+            'matched': True,
+            'staffId': top_match['staffId'],
+            'score': float(top_match['score']),
+            'confidence': match_confidence(top_match['score'])
+        }
+    
+    return {
+        'success': False,
+        'matched': False,
+        'message': 'No matching fingerprint found',
+        'bestScore': float(match_results[0]['score']) if match_results else 0
+    }
+
+class GalleryIndex:
+    """Gallery templates resolved once, with their global embeddings stacked into one float32 matrix"""
+    
+    def __init__(self, templates):
+        self.entries = []
+        for t in templates:
+            staff_id = t.get('staffId')
+            template = t.get('template', {})
+            
+            if not staff_id or not template:
+                continue
+            
+            template_id = t.get('template_id')
+            if template_id and template_id in template_cache:
+                template = template_cache[template_id]
+            
+            self.entries.append((staff_id, template))
+        
+        # Templates enrolled before embeddings existed stay unindexed until backfilled
+        embeddings = [template.get('embedding') for _, template in self.entries]
+        dim = next((len(e) for e in embeddings if e), 0)
+        self.indexed = [i for i, e in enumerate(embeddings) if e and len(e) == dim]
+        self.unindexed = [i for i, e in enumerate(embeddings) if not e or len(e) != dim]
+        self.matrix = np.asarray([embeddings[i] for i in self.indexed], np.float32).reshape(len(self.indexed), dim)
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def candidates(self, probe_embedding, top_k=None):
+        """Entry indices worth full scoring, best embedding similarity first, then unindexed entries"""
+        return self.rank([probe_embedding], top_k)[0]
+    
+    def rank(self, probe_embeddings, top_k=None):
+        """Candidate lists for many probes from one probes x gallery similarity product"""
+        top_k = top_k or Config.PREFILTER_TOP_K
+        everything = list(range(len(self.entries)))
+        ranked = [everything] * len(probe_embeddings)
+        if len(self.indexed) <= top_k:
+            return ranked
+        
+        dim = self.matrix.shape[1]
+        rankable = [i for i, e in enumerate(probe_embeddings) if e is not None and len(e) == dim]
+        if not rankable:
+            return ranked
+        
+        probes = np.asarray([probe_embeddings[i] for i in rankable], np.float32)
+        similarities = probes @ self.matrix.T
+        best = np.argpartition(-similarities, top_k, axis=1)[:, :top_k]
+        for row, i in enumerate(rankable):
+            order = best[row][np.argsort(-similarities[row, best[row]])]
+            ranked[i] = [self.indexed[j] for j in order] + self.unindexed
+        
+        return ranked
+    
+    def identify(self, features, top_k=None, candidates=None):
+        """Fully score the probe against its candidates; returns (results sorted best first, templates scored).
+        
+        Candidates come from the embedding pre-filter unless already ranked by rank().
+        Impostors routinely clear MATCH_THRESHOLD, so unless a candidate reaches
+        PREFILTER_ACCEPT_SCORE the rest of the gallery is scored too and a print
+        whose embedding ranks poorly is still found.
+        """
+        if candidates is None:
+            candidates = self.candidates(features.get('embedding'), top_k)
+        match_results = self._score(features, candidates)
+        
+        if len(candidates) < len(self.entries) and (
+                not match_results or max(r['score'] for r in match_results) < Config.PREFILTER_ACCEPT_SCORE):
+            scored = set(candidates)
+            remaining = [i for i in range(len(self.entries)) if i not in scored]
+            match_results += self._score(features, remaining)
+        
+        match_results.sort(key=lambda x: x['score'], reverse=True)
+        return match_results, len(match_results)
+    
+    def _score(self, features, indices):
+        match_results = []
+        for i in indices:
+            staff_id, template = self.entries[i]
+            score = ImprovedFingerprintMatcher.match_combined(features, template)
+            match_results.append({
+                'staffId': staff_id,
+                'score': float(score),
+                'quality': template.get('quality', {}).get('overall', 0)
+            })
+        return match_results
+
 @app.route('/api/fingerprint/match', methods=['POST'])
 def match_fingerprint():
     """Match a fingerprint against stored templates - enhanced version"""
@@ -590,67 +885,25 @@ def match_fingerprint():
         if 'templates' not in data or not data['templates']:
             return jsonify({'success': False, 'message': 'No templates provided'}), 400
             
-        match_results = []
-        matcher = ImprovedFingerprintMatcher()
-        
-        logger.info(f"Matching fingerprint against {len(data['templates'])} templates")
-        
-        for t in data['templates']:
-            staff_id = t.get('staffId')
-            template = t.get('template', {})
-            
-            if not staff_id or not template:
-                continue
-                
-            template_id = t.get('template_id')
-            if template_id and template_id in template_cache:
-                template = template_cache[template_id]
-                
-            score = matcher.match_combined(features, template)
-            
-            match_results.append({
-                'staffId': staff_id,
-                'score': float(score),
-                'quality': template.get('quality', {}).get('overall', 0)
-            })
+        gallery = GalleryIndex(data['templates'])
+        match_results, scored_count = gallery.identify(features)
+        summary = match_summary(match_results)
         
-        match_results.sort(key=lambda x: x['score'], reverse=True)
-        
-        if match_results and match_results[0]['score'] >= Config.MATCH_THRESHOLD:
-            top_match = match_results[0]
-            
-            confidence = "low"
-            if top_match['score'] >= 0.7:
-                confidence = "high"
-            elif top_match['score'] >= 0.55:
-                confidence = "medium"
-            
-            processing_time = time.time() - start_time
-            logger.info(f"Match found for staffId {top_match['staffId']} with score {top_match['score']:.3f}")
-            
-            return jsonify({
-                'success': True,
-                'matched': True,
-                'staffId': top_match['staffId'],
-                'score': float(top_match['score']),
-                'confidence': confidence,
-                'processing_time': float(processing_time)
-            })
+        processing_time = time.time() - start_time
+        if summary['matched']:
+            log_event('match_found', sampled=True, staff_id=summary['staffId'],
+                      score=summary['score'], template_count=len(gallery),
+                      scored_count=scored_count,
+                      duration=processing_time, timings=features.get('timings'))
         else:
-            processing_time = time.time() - start_time
-            logger.info(f"No match found. Best score: {match_results[0]['score'] if match_results else 0:.3f}")
-            
-            return jsonify({
-                'success': False,
-                'matched': False,
-                'message': 'No matching fingerprint found',
-                'bestScore': float(match_results[0]['score']) if match_results else 0,
-                'processing_time': float(processing_time)
-            })
+            log_event('match_not_found', sampled=True, best_score=summary['bestScore'],
+                      template_count=len(gallery), scored_count=scored_count,
+                      duration=processing_time, timings=features.get('timings'))
+        
+        return jsonify({**summary, 'processing_time': float(processing_time)})
     
     except Exception as e:
-        logger.error(f"Error in fingerprint matching: {e}")
-        traceback.print_exc()
+        log_event('match_error', level=logging.ERROR, exc_info=True, error=str(e))
         
         return jsonify({
             'success': False,
@@ -659,6 +912,112 @@ def match_fingerprint():
             'error': str(e)
         }), 500
 
+batch_pool = ThreadPoolExecutor(max_workers=NUM_CORES, thread_name_prefix='batch')
+
+@app.route('/api/fingerprint/match-batch', methods=['POST'])
+def match_fingerprint_batch():
+    """Identify a batch of buffered probes in one ranking pass, streaming one NDJSON result per probe in order"""
+    start_time = time.time()
+    data = request.get_json(silent=True)
+    
+    if not isinstance(data, dict) or not data.get('probes'):
+        return jsonify({'success': False, 'message': 'Missing probes'}), 400
+    
+    probes = data['probes']
+    if not isinstance(probes, list) or not all(isinstance(p, dict) for p in probes):
+        return jsonify({'success': False, 'message': 'Probes must be a list of objects'}), 400
+    
+    if len(probes) > Config.MAX_BATCH_SIZE:
+        return jsonify({
+            'success': False,
+            'message': f'Too many probes (max {Config.MAX_BATCH_SIZE} per batch)'
+        }), 400
+    
+    templates = data.get('templates')
+    if not templates:
+        return jsonify({'success': False, 'message': 'No templates provided'}), 400
+    
+    if not isinstance(templates, list) or not all(isinstance(t, dict) for t in templates):
+        return jsonify({'success': False, 'message': 'Templates must be a list of objects'}), 400
+    
+    try:
+        gallery = GalleryIndex(templates)
+    except Exception as e:
+        log_event('batch_setup_error', level=logging.ERROR, exc_info=True, error=str(e))
+        return jsonify({'success': False, 'message': f'Invalid templates: {str(e)}'}), 400
+    
+    def submit(fn, *args, **kwargs):
+        # Tasks run in a copy of this request's context so their log events carry the request id
+        return batch_pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    
+    extractions = [submit(process_fingerprint, probe.get('fingerPrint')) for probe in probes]
+    identifications = []
+    
+    def stream_results():
+        matched_count = 0
+        try:
+            features, errors = [], {}
+            for index, future in enumerate(extractions):
+                try:
+                    features.append(future.result())
+                except Exception as e:
+                    log_event('batch_probe_error', level=logging.ERROR, exc_info=True,
+                              index=index, error=str(e))
+                    features.append(None)
+                    errors[index] = str(e)
+            
+            # One embedding product ranks the whole batch; full scoring then runs on the pool
+            ranked = gallery.rank([f.get('embedding') if f else None for f in features])
+            identifications.extend(
+                submit(gallery.identify, f, candidates=candidates) if f else None
+                for f, candidates in zip(features, ranked)
+            )
+            
+            # Results go out in probe order so callers can apply them chronologically
+            for index, future in enumerate(identifications):
+                result = {'index': index, 'capturedAt': probes[index].get('capturedAt')}
+                
+                if future is None:
+                    result.update({
+                        'success': False,
+                        'matched': False,
+                        'message': (f'Error processing fingerprint: {errors[index]}' if index in errors
+                                    else 'Could not extract features from fingerprint')
+                    })
+                else:
+                    try:
+                        match_results, _ = future.result()
+                        result.update(match_summary(match_results))
+                        matched_count += result['matched']
+                    except Exception as e:
+                        log_event('batch_probe_error', level=logging.ERROR, exc_info=True,
+                                  index=index, error=str(e))
+                        result.update({
+                            'success': False,
+                            'matched': False,
+                            'message': f'Error processing fingerprint: {str(e)}'
+                        })
+                
+                yield json.dumps(result, cls=NumpyJSONEncoder) + '\n'
+            
+            processing_time = time.time() - start_time
+            log_event('batch_complete', probe_count=len(probes), matched_count=matched_count,
+                      template_count=len(gallery), duration=processing_time)
+            
+            yield json.dumps({
+                'done': True,
+                'count': len(probes),
+                'matched': matched_count,
+                'processing_time': float(processing_time)
+            }) + '\n'
+        finally:
+            # Drop queued work if the client disconnects mid-stream
+            for future in extractions + identifications:
+                if future is not None:
+                    future.cancel()
+    
+    return Response(stream_with_context(stream_results()), mimetype='application/x-ndjson')
+
 @app.route('/api/fingerprint/verify', methods=['POST'])
 def verify_fingerprint():
     """Verify a fingerprint against a specific staff ID - enhanced version"""
@@ -725,18 +1084,13 @@ def verify_fingerprint():
         verification_threshold = Config.MATCH_THRESHOLD * 0.9 
         verified = best_score >= verification_threshold
         
-        confidence = "low"
-        if best_score >= 0.7:
-            confidence = "high"
-        elif best_score >= 0.55:
-            confidence = "medium"
+        confidence = match_confidence(best_score)
         
         processing_time = time.time() - start_time
         
-        if verified:
-            logger.info(f"Fingerprint verified for staffId {staff_id} with score {best_score:.3f}")
-        else:
-            logger.info(f"Verification failed for staffId {staff_id}. Score: {best_score:.3f}")
+        log_event('verify_result', sampled=True, staff_id=staff_id, verified=verified,
+                  score=best_score, template_count=len(staff_templates),
+                  duration=processing_time, timings=features.get('timings'))
         
         return jsonify({
             'success': True,
@@ -748,8 +1102,7 @@ def verify_fingerprint():
         })
     
     except Exception as e:
-        logger.error(f"Error in fingerprint verification: {e}")
-        traceback.print_exc()
+        log_event('verify_error', level=logging.ERROR, exc_info=True, error=str(e))
         
         return jsonify({
             'success': False,
@@ -758,6 +1111,99 @@ def verify_fingerprint():
             'error': str(e)
         }), 500
 
+def synthetic_fingerprint(seed=0, size=(400, 360)):
+    """Base64 PNG of a synthetic ridge pattern used to exercise the pipeline during warm-up"""
+    rng = np.random.default_rng(seed)
+    height, width = size
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    cx = width / 2 + rng.uniform(-20, 20)
+    cy = height / 2 + rng.uniform(-20, 20)
+    
+    radius = np.hypot(xs - cx, (ys - cy) * 0.8)
+    angle = np.arctan2(ys - cy, xs - cx)
+    ridges = np.sin(radius / 3 + 2 * np.sin(2 * angle + seed))
+    finger = ((xs - cx) / (width * 0.38)) ** 2 + ((ys - cy) / (height * 0.45)) ** 2 <= 1
+    
+    img = np.where(finger, 128 + 90 * ridges, 220) + rng.normal(0, 6, (height, width))
+    _, png = cv2.imencode('.png', np.clip(img, 0, 255).astype(np.uint8))
+    return base64.b64encode(png.tobytes()).decode('ascii')
+
+def load_gallery_snapshot():
+    """Templates from Config.GALLERY_SNAPSHOT, used to run gallery-sized matching during warm-up.
+    
+    Nothing is cached: requests carry their own templates, so the snapshot only
+    exercises the matcher at a realistic gallery size.
+    """
+    if not Config.GALLERY_SNAPSHOT or not os.path.exists(Config.GALLERY_SNAPSHOT):
+        return []
+    
+    with open(Config.GALLERY_SNAPSHOT) as f:
+        snapshot = json.load(f)
+    
+    gallery = []
+    for t in snapshot:
+        staff_id = t.get('staffId')
+        template = t.get('template')
+        if not staff_id or not template:
+            continue
+        gallery.append({'staffId': staff_id, 'template': template})
+    
+    return gallery
+
+warmup_done = threading.Event()
+warmup_stats = {}
+
+def warm_up():
+    """Run the full extraction and matching pipeline once so real scans start warm"""
+    start_time = time.time()
+    try:
+        probes = [process_fingerprint(synthetic_fingerprint(seed)) for seed in range(Config.WARMUP_SCANS)]
+        probes = [p for p in probes if p]
+        
+        for probe in probes:
+            for template in probes:
+                ImprovedFingerprintMatcher.match_combined(probe, template)
+        
+        gallery = load_gallery_snapshot()
+        if probes:
+            templates = [{'staffId': f'warmup_{i}', 'template': p} for i, p in enumerate(probes)]
+            GalleryIndex(templates + gallery).identify(probes[0], top_k=1)
+        
+        warmup_stats['gallery_size'] = len(gallery)
+    except Exception as e:
+        # A failed warm-up only costs speed, so still report ready
+        log_event('warmup_error', level=logging.ERROR, exc_info=True, error=str(e))
+    finally:
+        warmup_stats['warmup_time'] = time.time() - start_time
+        warmup_stats['time_to_ready'] = time.time() - PROCESS_START
+        warmup_done.set()
+        log_event('ready', **warmup_stats)
+
+_server_started = False
+_start_lock = threading.Lock()
+
+def start_server():
+    """Initialise logging and start the warm-up in the background; later calls do nothing.
+    
+    Run by __main__, and otherwise on the first request, so a WSGI host that imports
+    the app also gets logging and readiness. Such hosts can call it at import time
+    to warm up before the first request arrives.
+    """
+    global _server_started
+    with _start_lock:
+        if _server_started:
+            return
+        _server_started = True
+    
+    setup_logging()
+    log_event('startup', cores=NUM_CORES, import_time=time.time() - PROCESS_START)
+    threading.Thread(target=warm_up, name='warmup', daemon=True).start()
+
+@app.before_request
+def ensure_started():
+    if not _server_started:
+        start_server()
+
 @app.route('/api/status', methods=['GET'])
 def server_status():
     """Get server status and statistics"""
@@ -769,7 +1215,8 @@ def server_status():
         'cached_templates': len(template_cache),
         'quality_threshold': Config.QUALITY_THRESHOLD,
         'match_threshold': Config.MATCH_THRESHOLD,
-        'debug_mode': Config.DEBUG_MODE
+        'debug_mode': Config.DEBUG_MODE,
+        'ready': warmup_done.is_set()
     })
 
 @app.route('/api/health', methods=['GET'])
@@ -777,6 +1224,18 @@ def health_check():
     """Simple health check endpoint"""
     return jsonify({'status': 'ok', 'timestamp': time.time()})
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness endpoint, succeeds once warm-up has completed"""
+    if not warmup_done.is_set():
+        return jsonify({'status': 'warming_up', 'timestamp': time.time()}), 503
+    
+    return jsonify({'status': 'ready', 'timestamp': time.time(), **warmup_stats})
+
 if __name__ == '__main__':
-    logger.info(f"Starting improved fingerprint server on port 5500 using {NUM_CORES} cores")
+    # With DEBUG_MODE the reloader re-runs this module in a child process that serves
+    # requests; only that child (WERKZEUG_RUN_MAIN set) should warm up.
+    if not Config.DEBUG_MODE or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_server()
+    log_event('server_start', port=5500, cores=NUM_CORES)
     app.run(host='0.0.0.0', port=5500, debug=Config.DEBUG_MODE, threaded=True)
\ No newline at end of file
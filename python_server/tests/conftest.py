@@ -0,0 +1,25 @@
+import base64
+import glob
+import os
+import sys
+
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASSETS_DIR = os.path.join(SERVER_DIR, '..', 'assets', 'fingerprints')
+
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope='session')
+def sample_images():
+    """Base64 PNG scans from assets/fingerprints, keyed by file name"""
+    paths = sorted(glob.glob(os.path.join(ASSETS_DIR, '*.png')))
+    if not paths:
+        pytest.skip('No sample fingerprints in assets/fingerprints')
+    
+    images = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            images[os.path.basename(path)] = base64.b64encode(f.read()).decode('ascii')
+    return images
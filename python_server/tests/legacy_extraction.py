@@ -0,0 +1,109 @@
+"""Reference copy of the original (pre-segmentation, findContours-based) extractor.
+
+Templates enrolled before the ROI crop were produced by this code. Tests use it
+as the reference for minutiae extraction and to compare match quality against
+the segmented extractor.
+"""
+import cv2
+import numpy as np
+
+import fingerprint_server_v2 as server
+
+def legacy_enhance(img):
+    height, width = img.shape
+    if width > server.Config.MAX_IMAGE_SIZE or height > server.Config.MAX_IMAGE_SIZE:
+        scale = min(server.Config.MAX_IMAGE_SIZE / width, server.Config.MAX_IMAGE_SIZE / height)
+        img = cv2.resize(img, None, fx=scale, fy=scale)
+    
+    hist_eq = cv2.equalizeHist(img)
+    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+    enhanced = clahe.apply(hist_eq)
+    blurred = cv2.GaussianBlur(enhanced, (5, 5), 0)
+    binary = cv2.adaptiveThreshold(
+        blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY_INV, 19, 2
+    )
+    morph = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, np.ones((3,3), np.uint8))
+    
+    return {'enhanced': enhanced, 'binary': binary, 'morph': morph}
+
+def legacy_minutiae(morph, binary):
+    minutiae_points = []
+    
+    contours, _ = cv2.findContours(morph, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for contour in contours[:50]:
+        if len(contour) > 3:
+            M = cv2.moments(contour)
+            if M["m00"] != 0:
+                area = cv2.contourArea(contour)
+                perimeter = cv2.arcLength(contour, True)
+                if area > 8:
+                    minutiae_points.append({
+                        'x': int(M["m10"] / M["m00"]),
+                        'y': int(M["m01"] / M["m00"]),
+                        'type': 'bifurcation' if area/perimeter > 1.5 else 'ending',
+                        'area': float(area)
+                    })
+    
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for contour in contours:
+        if len(contour) > 5:
+            M = cv2.moments(contour)
+            if M["m00"] != 0:
+                area = cv2.contourArea(contour)
+                if area > 10:
+                    minutiae_points.append({
+                        'x': int(M["m10"] / M["m00"]),
+                        'y': int(M["m01"] / M["m00"]),
+                        'type': 'contour',
+                        'area': float(area)
+                    })
+    
+    filtered_minutiae = []
+    used_positions = set()
+    for m in minutiae_points:
+        pos_key = f"{m['x']//5}_{m['y']//5}"
+        if pos_key not in used_positions:
+            filtered_minutiae.append(m)
+            used_positions.add(pos_key)
+    
+    return filtered_minutiae[:40]
+
+def legacy_keypoints(keypoints, detector):
+    return [{
+        'x': float(kp.pt[0]),
+        'y': float(kp.pt[1]),
+        'size': float(kp.size),
+        'angle': float(kp.angle) if kp.angle is not None else 0,
+        'response': float(kp.response),
+        'detector': detector
+    } for kp in keypoints[:30]]
+
+def legacy_template(image_data):
+    """Template exactly as /api/fingerprint/process-single built it originally"""
+    processed = legacy_enhance(server.base64_to_image(image_data))
+    minutiae = legacy_minutiae(processed['morph'], processed['binary'])
+    
+    orb = cv2.ORB_create(nfeatures=200, scaleFactor=1.2, WTA_K=3)
+    orb_keypoints, orb_descriptors = orb.detectAndCompute(processed['enhanced'], None)
+    akaze = cv2.AKAZE_create()
+    akaze_keypoints, akaze_descriptors = akaze.detectAndCompute(processed['enhanced'], None)
+    keypoints = legacy_keypoints(orb_keypoints, 'orb') + legacy_keypoints(akaze_keypoints, 'akaze')
+    
+    contrast = float(np.std(processed['enhanced']))
+    quality_score = min(100, (contrast / 2.5) * 0.3 +
+                        (min(len(keypoints), 100) / 100) * 0.4 +
+                        (min(len(minutiae), 20) / 20) * 0.3)
+    
+    return {
+        'minutiae': minutiae[:30],
+        'keypoints': keypoints[:40],
+        'orb_descriptors': (orb_descriptors.tolist() if orb_descriptors is not None else [])[:server.Config.MAX_TEMPLATE_SIZE],
+        'akaze_descriptors': (akaze_descriptors.tolist() if akaze_descriptors is not None else [])[:server.Config.MAX_TEMPLATE_SIZE],
+        'quality': {
+            'overall': float(quality_score),
+            'contrast': contrast,
+            'feature_count': len(keypoints),
+            'minutiae_count': len(minutiae)
+        }
+    }
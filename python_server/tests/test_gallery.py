@@ -0,0 +1,53 @@
+import itertools
+
+import pytest
+
+import fingerprint_server_v2 as server
+
+@pytest.fixture(scope='module')
+def features(sample_images):
+    return {name: server.process_fingerprint(image) for name, image in sample_images.items()}
+
+def test_accept_score_is_above_impostor_scores(features):
+    for a, b in itertools.permutations(features, 2):
+        score = server.ImprovedFingerprintMatcher.match_combined(features[a], features[b])
+        assert score < server.Config.PREFILTER_ACCEPT_SCORE, f'{a} vs {b} scored {score:.3f}'
+
+def test_match_outside_prefilter_is_still_found(features):
+    names = sorted(features)
+    probe_name = names[0]
+    probe = features[probe_name]
+
+    # Real impostors that borrow the probe's embedding crowd the true print out of the top-K
+    templates = [{'staffId': f'{name}-{i}', 'template': {**features[name], 'embedding': probe['embedding']}}
+                 for i in range(2) for name in names[1:]]
+    templates.append({'staffId': probe_name,
+                      'template': {**probe, 'embedding': [-v for v in probe['embedding']]}})
+
+    gallery = server.GalleryIndex(templates)
+    assert len(gallery) - 1 not in gallery.candidates(probe['embedding'])
+
+    match_results, scored_count = gallery.identify(probe)
+    assert match_results[0]['staffId'] == probe_name
+    assert scored_count == len(gallery)
+
+def test_confident_prefilter_match_skips_the_rest(features):
+    names = sorted(features)
+    templates = [{'staffId': f'{name}-{i}', 'template': features[name]}
+                 for i in range(2) for name in names]
+    gallery = server.GalleryIndex(templates)
+
+    match_results, scored_count = gallery.identify(features[names[0]])
+    assert match_results[0]['staffId'].startswith(names[0])
+    assert scored_count == server.Config.PREFILTER_TOP_K
+
+def test_batch_rank_matches_single_probe_ranking(features):
+    names = sorted(features)
+    templates = [{'staffId': f'{name}-{i}', 'template': features[name]}
+                 for i in range(2) for name in names]
+    gallery = server.GalleryIndex(templates)
+
+    embeddings = [features[name]['embedding'] for name in names] + [None, [1.0, 2.0]]
+    ranked = gallery.rank(embeddings)
+    assert ranked[:len(names)] == [gallery.candidates(e) for e in embeddings[:len(names)]]
+    assert ranked[-2:] == [list(range(len(gallery)))] * 2
@@ -0,0 +1,80 @@
+import json
+import threading
+
+import pytest
+
+import fingerprint_server_v2 as server
+
+@pytest.fixture
+def client(monkeypatch):
+    # Keep the first request from starting the logging listener and warm-up
+    monkeypatch.setattr(server, '_server_started', True)
+    return server.app.test_client()
+
+@pytest.mark.parametrize('probes', [['x'], [None], 'abc', {'fingerPrint': 'x'}])
+def test_malformed_probes_get_a_json_400(client, probes):
+    response = client.post('/api/fingerprint/match-batch',
+                           json={'probes': probes, 'templates': [{'staffId': 'a', 'template': {}}]})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+@pytest.mark.parametrize('body', ['abc', ['x'], None])
+def test_malformed_body_gets_a_json_400(client, body):
+    response = client.post('/api/fingerprint/match-batch', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+def test_malformed_templates_get_a_json_400(client, sample_images):
+    probes = [{'fingerPrint': next(iter(sample_images.values()))}]
+    for templates in (['x'], [{'staffId': 'a', 'template': 'abc'}]):
+        response = client.post('/api/fingerprint/match-batch', json={'probes': probes, 'templates': templates})
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
+
+def test_results_stream_in_submission_order(client, sample_images):
+    names = sorted(sample_images)[:3]
+    templates = [{'staffId': name, 'template': server.process_fingerprint(sample_images[name])} for name in names]
+    probes = [{'fingerPrint': sample_images[name], 'capturedAt': i} for i, name in enumerate(names)]
+    probes.insert(1, {'fingerPrint': None, 'capturedAt': 'bad'})
+
+    response = client.post('/api/fingerprint/match-batch',
+                           data=json.dumps({'probes': probes, 'templates': templates}, cls=server.NumpyJSONEncoder),
+                           content_type='application/json')
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert [line['index'] for line in lines[:-1]] == list(range(len(probes)))
+    assert lines[1]['matched'] is False
+    assert [line['staffId'] for line in lines[:-1] if line['matched']] == names
+    assert lines[-1] == {**lines[-1], 'done': True, 'count': len(probes), 'matched': len(names)}
+
+def test_extraction_threads_see_the_request_id(client, monkeypatch):
+    seen = []
+    def record_request_id(image):
+        seen.append(server.current_request_id.get())
+        return None
+    monkeypatch.setattr(server, 'process_fingerprint', record_request_id)
+
+    client.post('/api/fingerprint/match-batch', headers={'X-Request-Id': 'batch-42'},
+                json={'probes': [{'fingerPrint': 'x'}] * 3, 'templates': [{'staffId': 'a', 'template': {'minutiae': []}}]}).get_data()
+    assert seen == ['batch-42'] * 3
+
+def test_scoring_runs_on_the_pool(client, monkeypatch, sample_images):
+    seen = []
+    identify = server.GalleryIndex.identify
+    def record_thread(self, *args, **kwargs):
+        seen.append((threading.current_thread().name.startswith('batch'), server.current_request_id.get()))
+        return identify(self, *args, **kwargs)
+    monkeypatch.setattr(server.GalleryIndex, 'identify', record_thread)
+
+    names = sorted(sample_images)
+    templates = [{'staffId': f'{name}-{i}', 'template': server.process_fingerprint(sample_images[name])}
+                 for i in range(2) for name in names]
+    probes = [{'fingerPrint': sample_images[name], 'capturedAt': i} for i, name in enumerate(names[:3])]
+
+    response = client.post('/api/fingerprint/match-batch', headers={'X-Request-Id': 'batch-7'},
+                           data=json.dumps({'probes': probes, 'templates': templates}, cls=server.NumpyJSONEncoder),
+                           content_type='application/json')
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert [line['staffId'].rsplit('-', 1)[0] for line in lines[:-1]] == names[:3]
+    assert seen == [(True, 'batch-7')] * 3
@@ -0,0 +1,26 @@
+import pytest
+
+import fingerprint_server_v2 as server
+from legacy_extraction import legacy_enhance, legacy_minutiae
+
+@pytest.fixture(scope='module')
+def legacy_images(sample_images):
+    """Closed and raw binaries from the original enhancement, for both extractors to share"""
+    return [legacy_enhance(server.base64_to_image(image)) for image in sample_images.values()]
+
+def test_minutiae_match_string_key_dedup(legacy_images):
+    for processed in legacy_images:
+        old = legacy_minutiae(processed['morph'], processed['binary'])
+        new = server.extract_minutiae(processed['morph'], processed['binary'])
+        assert new == old
+
+def test_extraction_offset_shifts_points(legacy_images):
+    # Whole 5px cells, so the deduplication grid keeps the same points
+    processed = legacy_images[0]
+    base = server.extract_minutiae(processed['morph'], processed['binary'])
+    shifted = server.extract_minutiae(processed['morph'], processed['binary'], offset=(10, 5))
+    assert [(m['x'] + 10, m['y'] + 5, m['type']) for m in base] == [(m['x'], m['y'], m['type']) for m in shifted]
+
+def test_empty_image_has_no_minutiae():
+    blank = server.np.zeros((64, 64), server.np.uint8)
+    assert server.extract_minutiae(blank, blank) == []
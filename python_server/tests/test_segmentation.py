@@ -0,0 +1,60 @@
+import itertools
+
+import cv2
+import numpy as np
+import pytest
+
+import fingerprint_server_v2 as server
+from legacy_extraction import legacy_template
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(server, '_server_started', True)
+    return server.app.test_client()
+
+@pytest.fixture(scope='module')
+def features(sample_images):
+    return {name: server.process_fingerprint(image) for name, image in sample_images.items()}
+
+def resized(image):
+    img = server.base64_to_image(image)
+    scale = min(1, server.Config.MAX_IMAGE_SIZE / max(img.shape))
+    return cv2.resize(img, None, fx=scale, fy=scale)
+
+def test_crop_drops_background(sample_images):
+    for name, image in sample_images.items():
+        img = resized(image)
+        mask, (x0, y0, x1, y1) = server.segment_foreground(img)
+        assert (x1 - x0) * (y1 - y0) < 0.8 * img.size, name
+        assert (mask > 0).mean() >= server.Config.SEGMENT_MIN_COVERAGE, name
+
+def test_features_stay_on_the_fingerprint(sample_images, features):
+    for name, image in sample_images.items():
+        mask, (x0, y0, x1, y1) = server.segment_foreground(resized(image))
+        # AKAZE refines keypoints to sub-pixel positions, which can land just past the mask edge
+        mask = cv2.dilate(mask, np.ones((5, 5), np.uint8))
+        for kp in features[name]['keypoints']:
+            assert mask[int(kp['y']), int(kp['x'])] > 0, name
+        for m in features[name]['minutiae']:
+            assert x0 <= m['x'] < x1 and y0 <= m['y'] < y1, name
+
+def test_reextracted_templates_identify_their_scans(client, sample_images):
+    # Stored templates are migrated by re-extracting them through process-single
+    templates = []
+    for name, image in sample_images.items():
+        response = client.post('/api/fingerprint/process-single', json={'staffId': name, 'fingerPrint': image})
+        templates.append({'staffId': name, 'template': response.get_json()['template']})
+    gallery = server.GalleryIndex(templates)
+
+    for name, image in sample_images.items():
+        match_results, _ = gallery.identify(server.process_fingerprint(image))
+        assert match_results[0]['staffId'] == name
+        assert match_results[0]['score'] >= 0.99
+
+def test_masking_lowers_impostor_scores(sample_images, features):
+    legacy = {name: legacy_template(image) for name, image in sample_images.items()}
+    score = server.ImprovedFingerprintMatcher.match_combined
+
+    impostor = [score(features[a], features[b]) for a, b in itertools.permutations(features, 2)]
+    legacy_impostor = [score(legacy[a], legacy[b]) for a, b in itertools.permutations(legacy, 2)]
+    assert np.median(impostor) < np.median(legacy_impostor) - 0.1
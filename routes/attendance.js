@@ -4,6 +4,7 @@ const router = express.Router();
 const { protect, authorize } = require("../middlewares/auth");
 const {
   clockIn,
+  clockInBatch,
   submitReason,
   verifyReason,
   getStaffAttendance,
@@ -16,6 +17,7 @@ const {
 } = require("../controllers/attendanceController");
 
 router.post("/clock-in", clockIn);
+router.post("/clock-in-batch", protect, authorize("ADMIN"), clockInBatch);
 router.get("/getPublicAttendance", getPublicAttendance);
 
 router.get("/getAll", protect, authorize("ADMIN"), getAllAttendance);
@@ -7,6 +7,7 @@ const {
   deleteUser,
   enrollUSer,
   matchFingerprint,
+  updateFingerprints,
   getDepartments,
   updateProfile,
   updatePassword,
@@ -21,6 +22,7 @@ router.get("/getAll", protect, authorize("ADMIN"), getAllUsers);
 router.delete("/delete", protect, deleteUser);
 router.put("/update", protect, updateUser);
 router.post("/match", matchFingerprint);
+router.put("/update-fingerprints", protect, authorize("ADMIN"), updateFingerprints);
 router.get("/departments", protect, getDepartments);
 
 router.put("/update-profile", protect, uploadProfileImage, updateProfile);
@@ -7,6 +7,20 @@ const Users = require("../models/Users");
 const FINGERPRINT_SERVER_URL = process.env.FINGERPRINT_SERVER_URL || "5500";
 const FINGERPRINT_DIR = path.join(__dirname, "../assets/fingerprints");
 const QUALITY_THRESHOLD = 40;
+const MATCH_BATCH_SIZE = 500; // Probes per match-batch request; the Python server rejects larger batches
+
+// With responseType "stream" an error body arrives as a stream too
+const readErrorMessage = async (data) => {
+    try {
+        let body = "";
+        for await (const chunk of data) {
+            body += chunk.toString();
+        }
+        return JSON.parse(body).message;
+    } catch {
+        return undefined;
+    }
+};
 
 class FingerprintService {
     constructor() {
@@ -315,6 +329,110 @@ class FingerprintService {
         }
     }
 
+    async matchFingerprintBatch(probes, onResult) {
+        if (!Array.isArray(probes) || probes.length === 0) {
+            return {
+                success: false,
+                message: "Missing fingerprint probes",
+            };
+        }
+
+        console.log(`Starting batch fingerprint matching for ${probes.length} probes`);
+        const startTime = Date.now();
+
+        try {
+            const fingerprintRecords = await FingerPrint.find().lean();
+
+            if (fingerprintRecords.length === 0) {
+                return {
+                    success: false,
+                    message: "No fingerprints enrolled in the database",
+                };
+            }
+
+            const templates = fingerprintRecords.map((record) => ({
+                staffId: record.staffId.toString(),
+                template:
+                    this.templateCache.get(record.staffId.toString()) || record.template,
+            }));
+
+            const cleanProbes = probes.map(({ fingerPrint, capturedAt }) => ({
+                fingerPrint:
+                    typeof fingerPrint === "string" && fingerPrint.includes(",")
+                        ? fingerPrint.split(",")[1]
+                        : fingerPrint,
+                capturedAt,
+            }));
+
+            let count = 0;
+            let matched = 0;
+
+            // Sent in order, in batches the Python server accepts; result indices are
+            // shifted back to positions in the full probe list
+            for (let offset = 0; offset < cleanProbes.length; offset += MATCH_BATCH_SIZE) {
+                const response = await axios.post(
+                    `http://localhost:${FINGERPRINT_SERVER_URL}/api/fingerprint/match-batch`,
+                    { probes: cleanProbes.slice(offset, offset + MATCH_BATCH_SIZE), templates },
+                    { responseType: "stream", timeout: 120000 }
+                );
+
+                // Results arrive as newline-delimited JSON, one line per probe in probe order
+                let buffer = "";
+
+                for await (const chunk of response.data) {
+                    buffer += chunk.toString();
+
+                    let newline;
+                    while ((newline = buffer.indexOf("\n")) >= 0) {
+                        const line = buffer.slice(0, newline).trim();
+                        buffer = buffer.slice(newline + 1);
+
+                        if (!line) continue;
+
+                        const result = JSON.parse(line);
+                        if (result.done) {
+                            count += result.count;
+                            matched += result.matched;
+                        } else {
+                            await onResult({ ...result, index: result.index + offset });
+                        }
+                    }
+                }
+            }
+
+            return {
+                success: true,
+                count,
+                matched,
+                matchTime: Date.now() - startTime,
+            };
+        } catch (error) {
+            console.error("Batch fingerprint matching error:", error);
+
+            if (error.code === "ECONNREFUSED") {
+                return {
+                    success: false,
+                    message: "Fingerprint processing server is not available",
+                };
+            }
+
+            if (error.response) {
+                return {
+                    success: false,
+                    status: error.response.status,
+                    message:
+                        (await readErrorMessage(error.response.data)) ||
+                        `Server error: ${error.response.status}`,
+                };
+            }
+
+            return {
+                success: false,
+                message: error.message || "Failed to match fingerprints",
+            };
+        }
+    }
+
     async verifyFingerprint(data) {
         if (!data || !data.fingerPrint || !data.staffId) {
             return {
@@ -424,6 +542,56 @@ class FingerprintService {
         }
     }
 
+    async updateAllTemplates() {
+        const startTime = Date.now();
+        const records = await FingerPrint.find({ "file_paths.0": { $exists: true } });
+        console.log(`Re-extracting ${records.length} fingerprint templates`);
+
+        let updated = 0;
+        const failed = [];
+
+        for (const record of records) {
+            const staffId = record.staffId.toString();
+            const fileName = record.file_paths[0];
+
+            try {
+                const imageData = await fs.readFile(path.join(FINGERPRINT_DIR, fileName));
+                const processResponse = await this.processFingerprint(
+                    imageData.toString("base64"),
+                    staffId
+                );
+
+                if (!processResponse.success) {
+                    failed.push({ staffId, message: processResponse.message });
+                    continue;
+                }
+
+                // Replace the whole template so it comes from the same extractor as live probes;
+                // original_template keeps what was stored at enrollment
+                record.template = processResponse.template;
+                record.quality_score = processResponse.quality_score;
+                record.updated_at = new Date();
+                await record.save();
+
+                this.templateCache.set(staffId, record.template);
+                updated++;
+            } catch (error) {
+                console.error(
+                    `Failed to update template for staffId ${staffId}: ${error.message}`
+                );
+                failed.push({ staffId, message: error.message });
+            }
+        }
+
+        return {
+            success: failed.length === 0,
+            message: `Updated ${updated} of ${records.length} fingerprint templates`,
+            updated,
+            failed,
+            duration: Date.now() - startTime,
+        };
+    }
+
     clearCache() {
         this.templateCache.clear();
         console.log("Fingerprint template cache cleared");